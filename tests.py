@@ -1,5 +1,9 @@
+import io
 import math
+import os
+import tempfile
 import unittest
+from contextlib import redirect_stdout
 
 import profileir
 
@@ -18,15 +22,22 @@ class ProfileRetrievalTest(unittest.TestCase):
         tokens = profileir.tokenize(document)
         self.assertListEqual(['the', 'output', 'should', 'contain', 'six', 'word'], tokens)
 
+    def testTokenizeFile(self):
+        filename = '{}/fake-books.txt'.format(profileir.DOCUMENTS_DIR)
+        with open(filename) as document:
+            tokens = profileir.tokenize(document.read())
+        self.assertListEqual(tokens, profileir.tokenize_file(filename))
+        self.assertListEqual(tokens, list(profileir.tokenize_file(filename, mmap_min_size=0)))
+
     def testProfiles(self):
         terms, profiles = profileir.build_profiles(profileir.PROFILES_FILE)
         self.assertTrue(all(term in terms for term in {'movi', 'politic', 'soccer'}))
         profile1, profile2, profile3 = profiles[0], profiles[1], profiles[2]
-        self.assertEquals(profile1.name, 'User1')
+        self.assertEqual(profile1.name, 'User1')
         self.assertSetEqual(profile1.interests, {'movies', 'politics'})
-        self.assertEquals(profile2.name, 'User2')
+        self.assertEqual(profile2.name, 'User2')
         self.assertSetEqual(profile2.interests, {'politics', 'soccer'})
-        self.assertEquals(profile3.name, 'User3')
+        self.assertEqual(profile3.name, 'User3')
         self.assertSetEqual(profile3.interests, {'politics'})
 
     def testVectorSpace(self):
@@ -34,7 +45,7 @@ class ProfileRetrievalTest(unittest.TestCase):
         space = profileir.VectorSpace(axes)
         vector = space.as_normalized_vector({'movies': 2, 'politics': 2, 'soccer': 1})
         # sqrt(2**2 + 2**2 + 1**2) = 3
-        self.assertItemsEqual([2 / 3., 2 / 3., 1 / 3.], vector)
+        self.assertListEqual([2 / 3., 2 / 3., 1 / 3.], list(vector))
 
         def modulus(v): return sum([c ** 2 for c in v])
 
@@ -42,18 +53,26 @@ class ProfileRetrievalTest(unittest.TestCase):
 
         interests1 = {'movies': 1, 'politics': 1}
         profile1 = space.as_normalized_vector(interests1)
-        self.assertAlmostEquals(1, modulus(profile1), delta=1e-10, msg='Modulus of profile1 is not 1')
+        self.assertAlmostEqual(1, modulus(profile1), delta=1e-10, msg='Modulus of profile1 is not 1')
         interests2 = {'politics': 1, 'soccer': 1}
         profile2 = space.as_normalized_vector(interests2)
-        self.assertAlmostEquals(1, modulus(profile2), delta=1e-10, msg='Modulus of profile2 is not 1')
+        self.assertAlmostEqual(1, modulus(profile2), delta=1e-10, msg='Modulus of profile2 is not 1')
         interests3 = {'soccer': 1}
         profile3 = space.as_normalized_vector(interests3)
-        self.assertAlmostEquals(1, modulus(profile3), delta=1e-10, msg='Modulus of profile3 is not 1')
+        self.assertAlmostEqual(1, modulus(profile3), delta=1e-10, msg='Modulus of profile3 is not 1')
 
         self.assertAlmostEqual(math.cos(math.radians(60)), space.cos(profile1, profile2), delta=1e-10)
         self.assertAlmostEqual(math.cos(math.radians(45)), space.cos(profile2, profile3), delta=1e-10)
         self.assertAlmostEqual(1, space.cos(profile1, profile1), delta=1e-10)
         self.assertAlmostEqual(0, space.cos(profile1, profile3), delta=1e-10)
+        self.assertAlmostEqual(space.cos(profile1, profile2), space.cos_normalized(profile1, profile2), delta=1e-10)
+
+        compact_space = profileir.VectorSpace(axes, typecode='f')
+        compact_profile1 = compact_space.as_normalized_vector(interests1)
+        compact_profile2 = compact_space.as_normalized_vector(interests2)
+        self.assertAlmostEqual(1, modulus(compact_profile1), delta=1e-6, msg='Modulus of compact profile1 is not 1')
+        compact_cos = compact_space.cos_normalized(compact_profile1, compact_profile2)
+        self.assertAlmostEqual(math.cos(math.radians(60)), compact_cos, delta=1e-6)
 
         print('***** VECTOR SPACE TEST *****')
         print('Profiles in space: {}'.format(space.axes))
@@ -64,9 +83,26 @@ class ProfileRetrievalTest(unittest.TestCase):
 
     def testDictionary(self):
         dictionary = profileir.build_dictionary(profileir.DICTIONARY_FILE)
-        self.assertDictContainsSubset({'movi': 'movi', 'classic': 'movi', 'review': 'movi'}, dictionary)
-        self.assertDictContainsSubset({'politic': 'politic', 'media': 'politic', 'voter': 'politic'}, dictionary)
-        self.assertDictContainsSubset({'soccer': 'soccer', 'league': 'soccer', 'victory': 'soccer'}, dictionary)
+        expected = {'movi': 'movi', 'classic': 'movi', 'review': 'movi'}
+        self.assertEqual(expected, {k: dictionary.get(k) for k in expected})
+        expected = {'politic': 'politic', 'media': 'politic', 'voter': 'politic'}
+        self.assertEqual(expected, {k: dictionary.get(k) for k in expected})
+        expected = {'soccer': 'soccer', 'league': 'soccer', 'victory': 'soccer'}
+        self.assertEqual(expected, {k: dictionary.get(k) for k in expected})
+
+    def testTrailingWhitespace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiles_file = os.path.join(directory, 'profiles')
+            with open(profiles_file, 'w') as f:
+                f.write('User1#movies \n')
+            dictionary_file = os.path.join(directory, 'dictionary')
+            with open(dictionary_file, 'w') as f:
+                f.write('movies#film \n')
+            terms, profiles = profileir.build_profiles(profiles_file)
+            dictionary = profileir.build_dictionary(dictionary_file)
+        self.assertSetEqual({'movi'}, terms)
+        self.assertSetEqual({'movies'}, profiles[0].interests)
+        self.assertDictEqual({'movi': 'movi', 'film': 'movi'}, dictionary)
 
     def testCountFrequency(self):
         corpus = ['{}/blade-runner.txt'.format(profileir.DOCUMENTS_DIR)]
@@ -76,8 +112,21 @@ class ProfileRetrievalTest(unittest.TestCase):
         self.assertEqual(4, frequency['blade-runner']['movi'])
         self.assertEqual(0, frequency['blade-runner']['politic'])
         self.assertEqual(0, frequency['blade-runner']['soccer'])
+        self.assertNotIn('politic', frequency['blade-runner'], msg='Absent terms should not be stored')
         self.assertEqual(1, len(document_length))
 
+    def testTermLookup(self):
+        dictionary = {'blade': 'movi', 'runner': 'movi', 'essay': 'book'}
+        lookup = profileir.build_term_lookup({'movi', 'politic'}, dictionary)
+        self.assertDictEqual({'blade': 'movi', 'runner': 'movi'}, lookup)
+
+    def testCountFrequencyInParallel(self):
+        corpus = profileir.files_in_dir(profileir.DOCUMENTS_DIR)
+        vocabulary = {'movi', 'politic', 'soccer'}
+        dictionary = {'blade': 'movi', 'runner': 'movi', 'chelsea': 'soccer', 'voter': 'politic'}
+        expected = profileir.count_frequency(corpus, vocabulary, dictionary, workers=1)
+        self.assertEqual(expected, profileir.count_frequency(corpus, vocabulary, dictionary, workers=2))
+
     def testProfileScores(self):
         profile1 = profileir.Profile('User1', ['movies'])
         profile2 = profileir.Profile('User2', ['movies', 'politics'])
@@ -91,18 +140,29 @@ class ProfileRetrievalTest(unittest.TestCase):
         profileir.find_recommendations(profiles, corpus, vocabulary, dictionary,
                                        score_threshold=0, score_only_cos=True)
 
-        self.assertEquals(1, profile1.recommendations[document_id])
-        self.assertEquals(math.cos(math.radians(45)), profile2.recommendations[document_id])
-        self.assertEquals(0, len(profile3.recommendations))
+        self.assertEqual(1, profile1.recommendations[document_id])
+        self.assertAlmostEqual(math.cos(math.radians(45)), profile2.recommendations[document_id], delta=1e-10)
+        self.assertEqual(0, len(profile3.recommendations))
 
         print('***** PROFILE SCORES TEST *****')
-        map(lambda profile: profile.show_recommendations(), profiles)
+        for profile in profiles:
+            profile.show_recommendations()
         print('*******************************')
 
         profileir.find_recommendations(profiles, corpus, vocabulary, dictionary,
                                        score_threshold=0, score_only_cos=False)
         self.assertTrue(profile1.recommendations[document_id] < 1)
 
+    def testShowRecommendations(self):
+        profile = profileir.Profile('User1', ['movies'], top_k=1)
+        profile.add_recommendation('film-quiz', 0.4)
+        profile.add_recommendation('blade-runner', 0.8)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            profile.show_recommendations()
+        self.assertIn('blade-runner', output.getvalue())
+        self.assertNotIn('film-quiz', output.getvalue())
+
     def testIsTokenizable(self):
         self.assertTrue(profileir.is_tokenizable('file.txt'))
         self.assertFalse(profileir.is_tokenizable('file.xml'))